@@ -1,13 +1,11 @@
 import gradio as gr
-import pandas as pd
-import numpy as np
 from pathlib import Path
-import io
-from pydub import AudioSegment
-import tempfile
 import os
-from typing import Dict, List, Tuple, Optional
+from typing import List, Tuple
 import glob
+
+from audio_editor import AudioEditorApp, AUDIO_FORMATS, MIN_SHARD_SIZE_MB, SORT_KEYS
+
 def get_available_files(folder_path: str = None) -> List[Tuple[str, str]]:
     """Get list of available parquet files with their sizes from the specified folder"""
     if folder_path is None or folder_path == "":
@@ -32,301 +30,6 @@ def get_available_files(folder_path: str = None) -> List[Tuple[str, str]]:
     
     return file_info
 
-class AudioEditorApp:
-    def __init__(self, data_dir: str):
-        self.data_dir = Path(data_dir)
-        self.df = None
-        self.original_df = None
-        self.current_index = 0
-        self.modified_indices = set()
-        self.loaded = False
-        self.original_data = {}  # Maps row_id -> {'audio': bytes, 'text': str}
-        self.next_row_id = 0
-        
-    def load_data(self, selected_files: List[str] = None):
-        """Load selected parquet files from their full paths"""
-        import pyarrow.parquet as pq
-        
-        if selected_files is None or len(selected_files) == 0:
-            raise ValueError("No files selected to load")
-        
-        # selected_files now contains full paths
-        parquet_files = selected_files
-        
-        if not parquet_files:
-            raise ValueError(f"No parquet files found")
-        
-        print(f"Loading {len(parquet_files)} parquet files...")
-        dfs = []
-        for file in parquet_files:
-            print(f"Loading {Path(file).name}...")
-            
-            parquet_file = pq.ParquetFile(file)
-            total_rows = parquet_file.metadata.num_rows
-            print(f"  Total rows: {total_rows}")
-            
-            batches = []
-            batch_size = 1000  # Process 1000 rows at a time
-            for i, batch in enumerate(parquet_file.iter_batches(batch_size=batch_size)):
-                df_batch = batch.to_pandas()
-                batches.append(df_batch)
-                if (i + 1) % 10 == 0:  # Progress update every 10 batches
-                    print(f"  Loaded {(i + 1) * batch_size} / {total_rows} rows...")
-            
-            df_temp = pd.concat(batches, ignore_index=True)
-            df_temp['source_file'] = Path(file).name
-            dfs.append(df_temp)
-            print(f"  ✓ Completed loading {Path(file).name}")
-        
-        self.df = pd.concat(dfs, ignore_index=True)
-        self.original_df = self.df.copy()
-        self.loaded = True
-        self.current_index = 0
-        self.modified_indices = set()
-        
-        # Initialize row IDs and store original data
-        self.df['row_id'] = range(len(self.df))
-        self.next_row_id = len(self.df)
-        
-        # Store original audio and text for each row
-        for idx, row in self.df.iterrows():
-            row_id = row['row_id']
-            self.original_data[row_id] = {
-                'audio': row['audio']['bytes'],
-                'text': row['text']
-            }
-        
-        print(f"Loaded {len(self.df)} samples total")
-        
-    def bytes_to_audio_segment(self, audio_bytes: bytes) -> AudioSegment:
-        """Convert audio bytes to AudioSegment"""
-        return AudioSegment.from_file(io.BytesIO(audio_bytes), format="wav")
-    
-    def audio_segment_to_bytes(self, audio_segment: AudioSegment) -> bytes:
-        """Convert AudioSegment to bytes"""
-        buffer = io.BytesIO()
-        audio_segment.export(buffer, format="wav")
-        return buffer.getvalue()
-    
-    def is_loaded(self) -> bool:
-        """Check if data has been loaded"""
-        return self.loaded and self.df is not None
-    
-    def get_audio_file(self, index: int) -> str:
-        """Get audio as temporary file path for Gradio"""
-        if not self.is_loaded() or index < 0 or index >= len(self.df):
-            return None
-        
-        audio_bytes = self.df.iloc[index]['audio']['bytes']
-        
-        # Create temporary file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-        temp_file.write(audio_bytes)
-        temp_file.close()
-        
-        return temp_file.name
-    
-    def get_sample_info(self, index: int) -> Dict:
-        """Get all information for a sample"""
-        if not self.is_loaded() or index < 0 or index >= len(self.df):
-            return None
-        
-        row = self.df.iloc[index]
-        audio_bytes = row['audio']['bytes']
-        audio_segment = self.bytes_to_audio_segment(audio_bytes)
-        duration = len(audio_segment) / 1000.0  # Convert to seconds
-        
-        return {
-            'index': index,
-            'total': len(self.df),
-            'region': row['region'],
-            'province_code': row['province_code'],
-            'province_name': row['province_name'],
-            'filename': row['filename'],
-            'text': row['text'],
-            'speakerID': row['speakerID'],
-            'gender': 'Nam' if row['gender'] == 1 else 'Nữ',
-            'audio_duration': duration,
-            'source_file': row['source_file'],
-            'modified': index in self.modified_indices
-        }
-    
-    def update_text(self, index: int, new_text: str):
-        """Update the text transcript for a sample"""
-        if index >= 0 and index < len(self.df):
-            self.df.at[index, 'text'] = new_text
-            self.modified_indices.add(index)
-    
-    def trim_audio(self, index: int, start_ms: float, end_ms: float):
-        """Trim audio to specified range and create new entry for the remaining part"""
-        if index < 0 or index >= len(self.df):
-            return
-        
-        audio_bytes = self.df.iloc[index]['audio']['bytes']
-        audio_segment = self.bytes_to_audio_segment(audio_bytes)
-        
-        # Split audio into two parts
-        kept_part = audio_segment[start_ms:end_ms]
-        remaining_part = audio_segment[end_ms:]
-        
-        # Convert to bytes
-        kept_bytes = self.audio_segment_to_bytes(kept_part)
-        remaining_bytes = self.audio_segment_to_bytes(remaining_part)
-        
-        # Update the current row with the kept part
-        self.df.at[index, 'audio'] = {'bytes': kept_bytes}
-        self.modified_indices.add(index)
-        
-        # Only create a new row if there's remaining audio
-        if len(remaining_part) > 0:
-            # Create a new row for the remaining part by copying the current row
-            new_row = self.df.iloc[index].copy()
-            new_row['audio'] = {'bytes': remaining_bytes}
-            
-            # Generate new filename with numeric suffix
-            original_filename = new_row['filename']
-            # Find the next available number for this filename
-            base_filename = original_filename
-            counter = 1
-            # Check if filename already has a number suffix
-            if '{' in original_filename and '}' in original_filename:
-                # Extract base filename and current number
-                parts = original_filename.rsplit('{', 1)
-                base_filename = parts[0]
-                try:
-                    current_num = int(parts[1].rstrip('}'))
-                    counter = current_num + 1
-                except ValueError:
-                    pass
-            
-            # Find the highest existing number for this base filename
-            for _, row in self.df.iterrows():
-                fname = row['filename']
-                if fname.startswith(base_filename + '{'):
-                    try:
-                        num_part = fname.split('{')[1].rstrip('}')
-                        num = int(num_part)
-                        counter = max(counter, num + 1)
-                    except (IndexError, ValueError):
-                        pass
-            
-            new_row['filename'] = f"{base_filename}{{{counter}}}"
-            
-            # Assign a new unique row_id for the split segment
-            new_row_id = self.next_row_id
-            self.next_row_id += 1
-            new_row['row_id'] = new_row_id
-            
-            # Store original data for the new row (same as parent)
-            parent_row_id = self.df.iloc[index]['row_id']
-            self.original_data[new_row_id] = self.original_data[parent_row_id].copy()
-            
-            # Insert the new row right after the current index
-            # Split dataframe and concatenate
-            df_before = self.df.iloc[:index + 1]
-            df_after = self.df.iloc[index + 1:]
-            self.df = pd.concat([df_before, pd.DataFrame([new_row]), df_after], ignore_index=True)
-            
-            # Update modified indices - shift all indices after the insertion point
-            new_modified_indices = set()
-            for idx in self.modified_indices:
-                if idx <= index:
-                    new_modified_indices.add(idx)
-                else:
-                    new_modified_indices.add(idx + 1)
-            new_modified_indices.add(index + 1)  # Mark the new row as modified
-            self.modified_indices = new_modified_indices
-
-    
-    def reset_audio(self, index: int):
-        """Reset audio to original"""
-        if index < 0 or index >= len(self.df):
-            return
-        
-        # Get the row_id to find original data
-        row_id = self.df.iloc[index]['row_id']
-        if row_id in self.original_data:
-            original_audio_bytes = self.original_data[row_id]['audio']
-            self.df.at[index, 'audio'] = {'bytes': original_audio_bytes}
-            
-            # Check if text was also modified
-            original_text = self.original_data[row_id]['text']
-            if self.df.at[index, 'text'] == original_text:
-                self.modified_indices.discard(index)
-    
-    def reset_text(self, index: int):
-        """Reset text to original"""
-        if index < 0 or index >= len(self.df):
-            return
-        
-        # Get the row_id to find original data
-        row_id = self.df.iloc[index]['row_id']
-        if row_id in self.original_data:
-            original_text = self.original_data[row_id]['text']
-            self.df.at[index, 'text'] = original_text
-            
-            # Check if audio was also modified
-            original_audio_bytes = self.original_data[row_id]['audio']
-            current_audio_bytes = self.df.iloc[index]['audio']['bytes']
-            if original_audio_bytes == current_audio_bytes:
-                self.modified_indices.discard(index)
-    
-    def delete_audio(self, index: int) -> int:
-        """Delete an audio entry from the dataset
-        Returns the new current index after deletion"""
-        if index < 0 or index >= len(self.df):
-            return index
-        
-        self.df = self.df.drop(self.df.index[index]).reset_index(drop=True)
-        
-        new_modified_indices = set()
-        for idx in self.modified_indices:
-            if idx < index:
-                new_modified_indices.add(idx)
-            elif idx > index:
-                new_modified_indices.add(idx - 1)
-        self.modified_indices = new_modified_indices
-        
-
-        if len(self.df) > 0:
-            self.modified_indices.add(max(0, index - 1))
-        
-        new_index = min(index, len(self.df) - 1) if len(self.df) > 0 else 0
-        return new_index
-    
-    def save_modifications(self) -> str:
-        """Save all modifications to new parquet files"""
-        if len(self.modified_indices) == 0:
-            return "Không có thay đổi nào để lưu."
-        
-        # Group by source file
-        source_files = self.df['source_file'].unique()
-        saved_files = []
-        
-        output_dir = self.data_dir / "test_audio_edited"
-        output_dir.mkdir(exist_ok=True)
-        
-        for source_file in source_files:
-            # Get rows from this source file
-            mask = self.df['source_file'] == source_file
-            df_subset = self.df[mask].copy()
-            
-            # Drop the source_file and row_id columns before saving
-            df_subset = df_subset.drop(columns=['source_file', 'row_id'])
-            
-            # Save to new file
-            output_path = output_dir / source_file.replace('.parquet', '_edited.parquet')
-            df_subset.to_parquet(output_path, index=False)
-            saved_files.append(output_path.name)
-        
-        message = f"✅ Đã lưu {len(self.modified_indices)} mẫu đã chỉnh sửa vào {len(saved_files)} file:\n"
-        message += "\n".join(f"  - {f}" for f in saved_files[:10])
-        if len(saved_files) > 10:
-            message += f"\n  ... và {len(saved_files) - 10} file khác"
-        message += f"\n\nThư mục: {output_dir}"
-        
-        return message
-
 # Global app instance
 app = None
 
@@ -446,10 +149,17 @@ def delete_audio_handler(index: int):
     message = f"✅ Đã xóa mẫu {index + 1}. Tổng số mẫu còn lại: {len(app.df)}"
     return (message,) + results
 
-def save_handler():
+def save_handler(audio_format: str, shard_size_mb: float, sort_by: str):
     """Handle save operation"""
     app = init_app()
-    return app.save_modifications()
+    try:
+        return app.save_modifications(
+            audio_format=None if audio_format == "keep" else audio_format,
+            shard_size_mb=shard_size_mb or None,
+            sort_by=sort_by
+        )
+    except ValueError as e:
+        return f"❌ {str(e)}"
 
 # Create Gradio interface
 with gr.Blocks(title="Audio & Transcript Editor", theme=gr.themes.Soft()) as demo:
@@ -560,6 +270,26 @@ with gr.Blocks(title="Audio & Transcript Editor", theme=gr.themes.Soft()) as dem
             next_btn = gr.Button("Mẫu sau ➡️", size="lg")
             save_btn = gr.Button("💾 LƯU TẤT CẢ THAY ĐỔI", variant="primary", size="lg")
         
+        with gr.Row():
+            output_format = gr.Dropdown(
+                choices=["keep"] + AUDIO_FORMATS,
+                value="keep",
+                label="Định dạng audio khi lưu",
+                info="keep = giữ nguyên audio đã lưu; FLAC nén không mất dữ liệu, giảm dung lượng lưu trữ"
+            )
+            shard_size = gr.Number(
+                value=0,
+                minimum=0,
+                label="Kích thước mỗi shard (MB)",
+                info=f"0 = giữ một file đầu ra cho mỗi file nguồn, tối thiểu {MIN_SHARD_SIZE_MB} MB"
+            )
+            sort_order = gr.Dropdown(
+                choices=SORT_KEYS,
+                value="none",
+                label="Sắp xếp mẫu khi lưu",
+                info="Sắp xếp theo thời lượng hoặc speaker"
+            )
+        
         save_status = gr.Textbox(label="Kết quả lưu", interactive=False, lines=5)
     
     # Event handlers
@@ -670,6 +400,7 @@ with gr.Blocks(title="Audio & Transcript Editor", theme=gr.themes.Soft()) as dem
     
     save_btn.click(
         fn=save_handler,
+        inputs=[output_format, shard_size, sort_order],
         outputs=[save_status]
     )
 
@@ -0,0 +1,619 @@
+"""Audio/transcript editing core shared by the Gradio UI (app.py) and batch_edit.py"""
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import io
+from pydub import AudioSegment
+import tempfile
+import os
+from typing import Dict, List, Tuple, Optional
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+AUDIO_FORMATS = ["wav", "flac"]
+SORT_KEYS = ["none", "duration", "speaker"]
+MIN_SHARD_SIZE_MB = 1
+EDIT_OPS = ["trim", "delete", "text"]
+
+def detect_audio_format(audio_bytes: bytes) -> str:
+    """Detect the container of encoded audio bytes (FLAC magic header, WAV otherwise)"""
+    if audio_bytes[:4] == b"fLaC":
+        return "flac"
+    return "wav"
+
+def split_filename(filename: str) -> Tuple[str, int]:
+    """Split a filename like 'abc{2}' into its base and split number (0 if unsplit)"""
+    if '{' in filename and '}' in filename:
+        base, suffix = filename.rsplit('{', 1)
+        try:
+            return base, int(suffix.rstrip('}'))
+        except ValueError:
+            pass
+    return filename, 0
+
+def load_edit_spec(spec_path: str) -> pd.DataFrame:
+    """Load a CSV or JSONL file of edit operations keyed by filename
+    Columns: filename, op (trim/delete/text), start_ms, end_ms, text"""
+    if spec_path.endswith('.jsonl'):
+        edits = pd.read_json(spec_path, lines=True, dtype={'filename': str, 'text': str})
+    else:
+        edits = pd.read_csv(spec_path, dtype={'filename': str, 'text': str}, keep_default_na=False)
+    
+    for column in ['start_ms', 'end_ms', 'text']:
+        if column not in edits.columns:
+            edits[column] = None
+    # A missing 'op' column is reported by AudioEditorApp.validate_edits
+    if 'op' in edits.columns:
+        edits['op'] = edits['op'].astype(str).str.strip().str.lower()
+    edits['start_ms'] = pd.to_numeric(edits['start_ms'], errors='coerce')
+    edits['end_ms'] = pd.to_numeric(edits['end_ms'], errors='coerce')
+    return edits
+
+class AudioEditorApp:
+    def __init__(self, data_dir: str):
+        self.data_dir = Path(data_dir)
+        self.df = None
+        self.original_df = None
+        self.current_index = 0
+        self.modified_indices = set()
+        self.loaded = False
+        self.original_data = {}  # Maps row_id -> {'audio': bytes, 'text': str}
+        self.next_row_id = 0
+        
+    def load_data(self, selected_files: List[str] = None):
+        """Load selected parquet files from their full paths"""
+        import pyarrow.parquet as pq
+        
+        if selected_files is None or len(selected_files) == 0:
+            raise ValueError("No files selected to load")
+        
+        # selected_files now contains full paths
+        parquet_files = selected_files
+        
+        if not parquet_files:
+            raise ValueError(f"No parquet files found")
+        
+        print(f"Loading {len(parquet_files)} parquet files...")
+        dfs = []
+        for file in parquet_files:
+            print(f"Loading {Path(file).name}...")
+            
+            parquet_file = pq.ParquetFile(file)
+            total_rows = parquet_file.metadata.num_rows
+            print(f"  Total rows: {total_rows}")
+            
+            batches = []
+            batch_size = 1000  # Process 1000 rows at a time
+            for i, batch in enumerate(parquet_file.iter_batches(batch_size=batch_size)):
+                df_batch = batch.to_pandas()
+                batches.append(df_batch)
+                if (i + 1) % 10 == 0:  # Progress update every 10 batches
+                    print(f"  Loaded {(i + 1) * batch_size} / {total_rows} rows...")
+            
+            df_temp = pd.concat(batches, ignore_index=True)
+            df_temp['source_file'] = Path(file).name
+            dfs.append(df_temp)
+            print(f"  ✓ Completed loading {Path(file).name}")
+        
+        self.df = pd.concat(dfs, ignore_index=True)
+        self.original_df = self.df.copy()
+        self.loaded = True
+        self.current_index = 0
+        self.modified_indices = set()
+        
+        # Initialize row IDs and store original data
+        self.df['row_id'] = range(len(self.df))
+        self.next_row_id = len(self.df)
+        
+        # Store original audio and text for each row
+        for idx, row in self.df.iterrows():
+            row_id = row['row_id']
+            self.original_data[row_id] = {
+                'audio': row['audio']['bytes'],
+                'text': row['text']
+            }
+        
+        print(f"Loaded {len(self.df)} samples total")
+        
+    def bytes_to_audio_segment(self, audio_bytes: bytes) -> AudioSegment:
+        """Convert audio bytes (WAV or FLAC) to AudioSegment"""
+        return AudioSegment.from_file(io.BytesIO(audio_bytes), format=detect_audio_format(audio_bytes))
+    
+    def audio_segment_to_bytes(self, audio_segment: AudioSegment, audio_format: str = "wav") -> bytes:
+        """Convert AudioSegment to bytes"""
+        buffer = io.BytesIO()
+        audio_segment.export(buffer, format=audio_format)
+        return buffer.getvalue()
+    
+    def encode_clip(self, audio_bytes: bytes, audio_format: Optional[str] = None,
+                    with_duration: bool = False) -> Tuple[bytes, Optional[float]]:
+        """Re-encode one clip to audio_format (None keeps it as-is)
+        Returns the encoded bytes and, if decoded, the clip duration in milliseconds"""
+        needs_encode = audio_format is not None and detect_audio_format(audio_bytes) != audio_format
+        if not needs_encode:
+            return audio_bytes, self.get_duration_ms(audio_bytes) if with_duration else None
+        
+        audio_segment = self.bytes_to_audio_segment(audio_bytes)
+        if needs_encode:
+            audio_bytes = self.audio_segment_to_bytes(audio_segment, audio_format)
+        return audio_bytes, len(audio_segment)
+    
+    def is_loaded(self) -> bool:
+        """Check if data has been loaded"""
+        return self.loaded and self.df is not None
+    
+    def get_audio_file(self, index: int) -> str:
+        """Get audio as temporary file path for Gradio"""
+        if not self.is_loaded() or index < 0 or index >= len(self.df):
+            return None
+        
+        audio_bytes = self.df.iloc[index]['audio']['bytes']
+        
+        # Create temporary file
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.' + detect_audio_format(audio_bytes))
+        temp_file.write(audio_bytes)
+        temp_file.close()
+        
+        return temp_file.name
+    
+    def get_sample_info(self, index: int) -> Dict:
+        """Get all information for a sample"""
+        if not self.is_loaded() or index < 0 or index >= len(self.df):
+            return None
+        
+        row = self.df.iloc[index]
+        audio_bytes = row['audio']['bytes']
+        audio_segment = self.bytes_to_audio_segment(audio_bytes)
+        duration = len(audio_segment) / 1000.0  # Convert to seconds
+        
+        return {
+            'index': index,
+            'total': len(self.df),
+            'region': row['region'],
+            'province_code': row['province_code'],
+            'province_name': row['province_name'],
+            'filename': row['filename'],
+            'text': row['text'],
+            'speakerID': row['speakerID'],
+            'gender': 'Nam' if row['gender'] == 1 else 'Nữ',
+            'audio_duration': duration,
+            'source_file': row['source_file'],
+            'modified': index in self.modified_indices
+        }
+    
+    def update_text(self, index: int, new_text: str):
+        """Update the text transcript for a sample"""
+        if index >= 0 and index < len(self.df):
+            self.df.at[index, 'text'] = new_text
+            self.modified_indices.add(index)
+    
+    def trim_audio(self, index: int, start_ms: float, end_ms: float):
+        """Trim audio to specified range and create new entry for the remaining part"""
+        if index < 0 or index >= len(self.df):
+            return
+        
+        audio_bytes = self.df.iloc[index]['audio']['bytes']
+        audio_segment = self.bytes_to_audio_segment(audio_bytes)
+        
+        # Split audio into two parts
+        kept_part = audio_segment[start_ms:end_ms]
+        remaining_part = audio_segment[end_ms:]
+        
+        # Convert to bytes, keeping the source clip's format
+        audio_format = detect_audio_format(audio_bytes)
+        kept_bytes = self.audio_segment_to_bytes(kept_part, audio_format)
+        remaining_bytes = self.audio_segment_to_bytes(remaining_part, audio_format)
+        
+        # Update the current row with the kept part
+        self.df.at[index, 'audio'] = {'bytes': kept_bytes}
+        self.modified_indices.add(index)
+        
+        # Only create a new row if there's remaining audio
+        if len(remaining_part) > 0:
+            # Create a new row for the remaining part by copying the current row
+            new_row = self.df.iloc[index].copy()
+            new_row['audio'] = {'bytes': remaining_bytes}
+            
+            # Generate new filename with numeric suffix
+            base_filename, current_num = split_filename(new_row['filename'])
+            counter = current_num + 1
+            
+            # Find the highest existing number for this base filename
+            for fname in self.df['filename']:
+                base, num = split_filename(fname)
+                if base == base_filename and num > 0:
+                    counter = max(counter, num + 1)
+            
+            new_row['filename'] = f"{base_filename}{{{counter}}}"
+            
+            # Assign a new unique row_id for the split segment
+            new_row_id = self.next_row_id
+            self.next_row_id += 1
+            new_row['row_id'] = new_row_id
+            
+            # Store original data for the new row (same as parent)
+            parent_row_id = self.df.iloc[index]['row_id']
+            self.original_data[new_row_id] = self.original_data[parent_row_id].copy()
+            
+            # Insert the new row right after the current index
+            # Split dataframe and concatenate
+            df_before = self.df.iloc[:index + 1]
+            df_after = self.df.iloc[index + 1:]
+            self.df = pd.concat([df_before, pd.DataFrame([new_row]), df_after], ignore_index=True)
+            
+            # Update modified indices - shift all indices after the insertion point
+            new_modified_indices = set()
+            for idx in self.modified_indices:
+                if idx <= index:
+                    new_modified_indices.add(idx)
+                else:
+                    new_modified_indices.add(idx + 1)
+            new_modified_indices.add(index + 1)  # Mark the new row as modified
+            self.modified_indices = new_modified_indices
+
+    
+    def reset_audio(self, index: int):
+        """Reset audio to original"""
+        if index < 0 or index >= len(self.df):
+            return
+        
+        # Get the row_id to find original data
+        row_id = self.df.iloc[index]['row_id']
+        if row_id in self.original_data:
+            original_audio_bytes = self.original_data[row_id]['audio']
+            self.df.at[index, 'audio'] = {'bytes': original_audio_bytes}
+            
+            # Check if text was also modified
+            original_text = self.original_data[row_id]['text']
+            if self.df.at[index, 'text'] == original_text:
+                self.modified_indices.discard(index)
+    
+    def reset_text(self, index: int):
+        """Reset text to original"""
+        if index < 0 or index >= len(self.df):
+            return
+        
+        # Get the row_id to find original data
+        row_id = self.df.iloc[index]['row_id']
+        if row_id in self.original_data:
+            original_text = self.original_data[row_id]['text']
+            self.df.at[index, 'text'] = original_text
+            
+            # Check if audio was also modified
+            original_audio_bytes = self.original_data[row_id]['audio']
+            current_audio_bytes = self.df.iloc[index]['audio']['bytes']
+            if original_audio_bytes == current_audio_bytes:
+                self.modified_indices.discard(index)
+    
+    def delete_audio(self, index: int) -> int:
+        """Delete an audio entry from the dataset
+        Returns the new current index after deletion"""
+        if index < 0 or index >= len(self.df):
+            return index
+        
+        self.df = self.df.drop(self.df.index[index]).reset_index(drop=True)
+        
+        new_modified_indices = set()
+        for idx in self.modified_indices:
+            if idx < index:
+                new_modified_indices.add(idx)
+            elif idx > index:
+                new_modified_indices.add(idx - 1)
+        self.modified_indices = new_modified_indices
+        
+
+        if len(self.df) > 0:
+            self.modified_indices.add(max(0, index - 1))
+        
+        new_index = min(index, len(self.df) - 1) if len(self.df) > 0 else 0
+        return new_index
+    
+    def validate_edits(self, edits: pd.DataFrame) -> List[str]:
+        """Check edit operations against the loaded data, returning one message per problem"""
+        errors = []
+        
+        for column in ['filename', 'op']:
+            if column not in edits.columns:
+                return [f"Missing required column '{column}'"]
+        
+        counts = self.df['filename'].value_counts()
+        trims_to_check = []
+        for line, edit in zip(edits.index + 1, edits.itertuples(index=False)):
+            if edit.op not in EDIT_OPS:
+                errors.append(f"Row {line}: unknown op '{edit.op}' (expected one of {EDIT_OPS})")
+            unique_file = edit.filename in counts.index and counts[edit.filename] == 1
+            if edit.filename not in counts.index:
+                errors.append(f"Row {line}: filename '{edit.filename}' not found in loaded files")
+            elif not unique_file:
+                errors.append(f"Row {line}: filename '{edit.filename}' is not unique in loaded files")
+            if edit.op == "trim":
+                if pd.isna(edit.start_ms) or pd.isna(edit.end_ms):
+                    errors.append(f"Row {line}: trim needs numeric start_ms and end_ms")
+                elif edit.start_ms < 0 or edit.start_ms >= edit.end_ms:
+                    errors.append(f"Row {line}: trim needs 0 <= start_ms < end_ms")
+                elif unique_file:
+                    trims_to_check.append((line, edit))
+            if edit.op == "text" and (edit.text is None or pd.isna(edit.text) or not str(edit.text).strip()):
+                errors.append(f"Row {line}: text op needs a non-empty text value")
+        
+        # Each clip gets at most one op of each kind, and a deleted clip nothing else
+        op_counts = edits.groupby(['filename', 'op']).size()
+        for (filename, op), count in op_counts[op_counts > 1].items():
+            errors.append(f"Filename '{filename}' has {count} '{op}' ops")
+        deleted = set(edits.loc[edits['op'] == "delete", 'filename'])
+        for filename in sorted(deleted & set(edits.loc[edits['op'] != "delete", 'filename'])):
+            errors.append(f"Filename '{filename}' is deleted and also edited")
+        if len(deleted) >= len(self.df):
+            errors.append("Cannot delete every sample")
+        
+        # Trims must start inside the clip, otherwise the kept audio would be empty
+        audio_by_name = self.df.set_index('filename')['audio']
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            durations = list(executor.map(
+                lambda item: self.get_duration_ms(audio_by_name[item[1].filename]['bytes']),
+                trims_to_check
+            ))
+        for (line, edit), duration in zip(trims_to_check, durations):
+            if edit.start_ms >= duration:
+                errors.append(f"Row {line}: trim start_ms {edit.start_ms:g} is past the clip end ({duration:.0f} ms)")
+        
+        return errors
+    
+    def get_duration_ms(self, audio_bytes: bytes) -> float:
+        """Clip duration in milliseconds, read from the WAV/FLAC header when possible"""
+        if detect_audio_format(audio_bytes) == "flac":
+            # STREAMINFO is always the first metadata block: 20-bit sample rate,
+            # 3-bit channels, 5-bit bits per sample, then 36-bit total samples
+            if len(audio_bytes) >= 26 and audio_bytes[4] & 0x7F == 0:
+                streaminfo = int.from_bytes(audio_bytes[18:26], "big")
+                sample_rate = streaminfo >> 44
+                total_samples = streaminfo & ((1 << 36) - 1)
+                if sample_rate > 0 and total_samples > 0:
+                    return total_samples * 1000.0 / sample_rate
+        else:
+            try:
+                with wave.open(io.BytesIO(audio_bytes)) as wav_file:
+                    return wav_file.getnframes() * 1000.0 / wav_file.getframerate()
+            except (wave.Error, EOFError):
+                pass
+        return len(self.bytes_to_audio_segment(audio_bytes))
+    
+    def split_clip(self, audio_bytes: bytes, start_ms: float, end_ms: float) -> Tuple[bytes, Optional[bytes]]:
+        """Decode a clip once and return the kept part and the remaining part (None if empty)"""
+        audio_segment = self.bytes_to_audio_segment(audio_bytes)
+        if start_ms >= len(audio_segment):
+            raise ValueError(f"Trim start {start_ms:g} ms is past the clip end ({len(audio_segment)} ms)")
+        kept_part = audio_segment[start_ms:end_ms]
+        remaining_part = audio_segment[end_ms:]
+        audio_format = detect_audio_format(audio_bytes)
+        remaining_bytes = self.audio_segment_to_bytes(remaining_part, audio_format) if len(remaining_part) > 0 else None
+        return self.audio_segment_to_bytes(kept_part, audio_format), remaining_bytes
+    
+    def apply_edits(self, edits: pd.DataFrame, dry_run: bool = False) -> str:
+        """Apply a batch of trim/delete/text ops in one pass over the dataframe
+        Same semantics as the per-sample buttons, but row order is rebuilt only once
+        and every trimmed clip is decoded once, in parallel (validation only reads WAV/FLAC headers)
+        Raises ValueError with the report if validation fails, also in dry-run mode"""
+        errors = self.validate_edits(edits)
+        op_counts = edits['op'].value_counts() if 'op' in edits.columns else pd.Series(dtype=int)
+        
+        report = f"Số thao tác: {len(edits)} (trim: {op_counts.get('trim', 0)}, "
+        report += f"delete: {op_counts.get('delete', 0)}, text: {op_counts.get('text', 0)})\n"
+        if errors:
+            report += f"❌ {len(errors)} lỗi:\n" + "\n".join(f"  - {e}" for e in errors[:50])
+            if len(errors) > 50:
+                report += f"\n  ... và {len(errors) - 50} lỗi khác"
+            raise ValueError(report)
+        
+        if dry_run:
+            return report + "✅ Dry run: không có lỗi, chưa áp dụng thay đổi nào."
+        
+        # Only filenames referenced by the spec, which validation guarantees are unique
+        referenced = self.df['filename'].isin(edits['filename'])
+        positions = pd.Series(np.flatnonzero(referenced), index=self.df['filename'][referenced])
+        edits = edits.assign(position=edits['filename'].map(positions).to_numpy())
+        modified_row_ids = set(self.df['row_id'].iloc[list(self.modified_indices)])
+        
+        # Decode and split every trimmed clip before touching self.df, so a failure leaves it unchanged
+        trim_ops = edits[edits['op'] == "trim"]
+        audio_col = self.df.columns.get_loc('audio')
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            split_parts = list(executor.map(
+                lambda op: self.split_clip(self.df.iat[op.position, audio_col]['bytes'], op.start_ms, op.end_ms),
+                trim_ops.itertuples(index=False)
+            ))
+        
+        # Text fixes
+        text_ops = edits[edits['op'] == "text"]
+        text_col = self.df.columns.get_loc('text')
+        self.df.iloc[text_ops['position'].to_numpy(), text_col] = text_ops['text'].to_numpy()
+        modified_row_ids.update(self.df['row_id'].iloc[text_ops['position']])
+        
+        # Trims: the kept part stays in place, the remaining part becomes a new row right after it
+        next_split = {}
+        for fname in self.df['filename']:
+            base, num = split_filename(fname)
+            next_split[base] = max(next_split.get(base, 1), num + 1)
+        
+        new_rows = []
+        for op, (kept_bytes, remaining_bytes) in zip(trim_ops.itertuples(index=False), split_parts):
+            self.df.iat[op.position, audio_col] = {'bytes': kept_bytes}
+            parent_row_id = self.df['row_id'].iat[op.position]
+            modified_row_ids.add(parent_row_id)
+            if remaining_bytes is None:
+                continue
+            
+            new_row = self.df.iloc[op.position].copy()
+            new_row['audio'] = {'bytes': remaining_bytes}
+            base_filename, _ = split_filename(new_row['filename'])
+            new_row['filename'] = f"{base_filename}{{{next_split[base_filename]}}}"
+            next_split[base_filename] += 1
+            
+            new_row['row_id'] = self.next_row_id
+            self.original_data[self.next_row_id] = self.original_data[parent_row_id].copy()
+            modified_row_ids.add(self.next_row_id)
+            self.next_row_id += 1
+            # Sort key places the split part right after its parent
+            new_row['_order'] = op.position + 0.5
+            new_rows.append(new_row)
+        
+        # Deletes, then a single rebuild of the row order
+        deleted = np.zeros(len(self.df), dtype=bool)
+        deleted[edits.loc[edits['op'] == "delete", 'position'].to_numpy(dtype=int)] = True
+        df_kept = self.df.assign(_order=np.arange(len(self.df), dtype=float))[~deleted]
+        self.df = (
+            pd.concat([df_kept, pd.DataFrame(new_rows)], ignore_index=True)
+            .sort_values('_order', kind="stable")
+            .drop(columns=['_order'])
+            .reset_index(drop=True)
+        )
+        
+        # Like delete_audio, mark the sample before each deleted one so the deletion gets saved
+        kept_positions = np.flatnonzero(~deleted)
+        neighbours = np.maximum(np.searchsorted(kept_positions, np.flatnonzero(deleted)) - 1, 0)
+        modified_row_ids.update(df_kept['row_id'].iloc[neighbours])
+        self.modified_indices = set(np.flatnonzero(self.df['row_id'].isin(modified_row_ids)).tolist())
+        
+        report += f"✅ Đã áp dụng. Tổng số mẫu hiện tại: {len(self.df)}"
+        return report
+    
+    def prepare_output(self, audio_format: Optional[str] = None, sort_by: str = "none") -> pd.DataFrame:
+        """Build the dataframe to save: re-encode audio and reorder rows if requested
+        Clips are encoded in parallel since pydub hands the work to ffmpeg subprocesses"""
+        df_out = self.df.drop(columns=['row_id'])
+        
+        if audio_format is not None or sort_by == "duration":
+            audio_bytes = [audio['bytes'] for audio in df_out['audio']]
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                encoded = list(executor.map(
+                    lambda b: self.encode_clip(b, audio_format, with_duration=sort_by == "duration"),
+                    audio_bytes
+                ))
+            df_out['audio'] = [{**audio, 'bytes': clip} for audio, (clip, _) in zip(df_out['audio'], encoded)]
+        
+        # Sort for locality: similar lengths batch well, one speaker stays in one shard
+        if sort_by == "duration":
+            order = np.argsort([duration for _, duration in encoded], kind="stable")
+            df_out = df_out.iloc[order].reset_index(drop=True)
+        elif sort_by == "speaker":
+            df_out = df_out.sort_values('speakerID', kind="stable").reset_index(drop=True)
+        
+        return df_out
+    
+    def shard_prefix(self, source_files: List[str]) -> str:
+        """Shard name prefix from the split of the source files (e.g. test_edited)"""
+        splits = set()
+        for name in source_files:
+            split = name.split('-')[0]
+            # Re-editing saved shards must not grow the name (test_edited_edited-...)
+            while split.endswith('_edited'):
+                split = split[:-len('_edited')]
+            splits.add(split)
+        split = splits.pop() if len(splits) == 1 else "edited"
+        return "edited" if split == "edited" else f"{split}_edited"
+    
+    def write_shards(self, df_out: pd.DataFrame, output_dir: Path, prefix: str, shard_size_mb: float,
+                     row_group_size: int = 100) -> List[Path]:
+        """Repack rows into shards of roughly shard_size_mb with small row groups and page indexes
+        Shards are written as .parquet.tmp files; replace_outputs moves them into place"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        df_out = df_out.drop(columns=['source_file'])
+        
+        # Audio dominates the row size, so cut shards on the cumulative audio byte count
+        row_bytes = np.array([len(audio['bytes']) for audio in df_out['audio']], dtype=np.int64)
+        shard_ids = (np.cumsum(row_bytes) - row_bytes) // int(shard_size_mb * 1024 * 1024)
+        boundaries = np.flatnonzero(np.diff(shard_ids)) + 1
+        starts = [0] + boundaries.tolist()
+        ends = boundaries.tolist() + [len(df_out)]
+        
+        table = pa.Table.from_pandas(df_out, preserve_index=False)
+        written = []
+        for shard, (start, end) in enumerate(zip(starts, ends)):
+            tmp_path = output_dir / f"{prefix}-{shard:05d}-of-{len(starts):05d}.parquet.tmp"
+            written.append(tmp_path)
+            pq.write_table(
+                table.slice(start, end - start),
+                tmp_path,
+                row_group_size=row_group_size,
+                write_page_index=True
+            )
+        
+        return written
+    
+    def write_per_source(self, df_out: pd.DataFrame, output_dir: Path) -> List[Path]:
+        """Write one <source>_edited.parquet.tmp file per source file"""
+        written = []
+        # Group by source file
+        for source_file in df_out['source_file'].unique():
+            # Get rows from this source file
+            mask = df_out['source_file'] == source_file
+            df_subset = df_out[mask].drop(columns=['source_file'])
+            
+            # Save to new file
+            tmp_path = output_dir / source_file.replace('.parquet', '_edited.parquet.tmp')
+            written.append(tmp_path)
+            df_subset.to_parquet(tmp_path, index=False)
+        
+        return written
+    
+    def replace_outputs(self, output_dir: Path, written: List[Path], stale_patterns: List[str]) -> List[str]:
+        """Move freshly written .tmp files into place, then remove outputs of earlier saves
+        (in either layout) so the folder never holds the same rows twice"""
+        final_paths = [tmp_path.with_suffix('') for tmp_path in written]
+        for tmp_path, final_path in zip(written, final_paths):
+            tmp_path.replace(final_path)
+        
+        for pattern in stale_patterns:
+            for stale_file in output_dir.glob(pattern):
+                if stale_file not in final_paths:
+                    stale_file.unlink()
+        
+        return [final_path.name for final_path in final_paths]
+    
+    def save_modifications(self, audio_format: Optional[str] = None, shard_size_mb: Optional[float] = None,
+                           sort_by: str = "none", row_group_size: int = 100) -> str:
+        """Save all modifications to new parquet files
+        
+        audio_format: re-encode every clip to "wav" or "flac" (None keeps the stored bytes)
+        shard_size_mb: repack rows into shards of this size instead of one file per source file
+        sort_by: "duration" or "speaker" to reorder rows for locality before writing
+        """
+        if shard_size_mb is not None and shard_size_mb < MIN_SHARD_SIZE_MB:
+            raise ValueError(f"shard_size_mb must be at least {MIN_SHARD_SIZE_MB} MB, got {shard_size_mb}")
+        
+        if len(self.modified_indices) == 0:
+            return "Không có thay đổi nào để lưu."
+        
+        output_dir = self.data_dir / "test_audio_edited"
+        output_dir.mkdir(exist_ok=True)
+        
+        df_out = self.prepare_output(audio_format, sort_by)
+        source_files = list(df_out['source_file'].unique())
+        prefix = self.shard_prefix(source_files)
+        
+        # Outputs of both layouts for these source files; whichever was saved before is replaced
+        stale_patterns = [f"{prefix}-*-of-*.parquet"]
+        stale_patterns += [source_file.replace('.parquet', '_edited.parquet') for source_file in source_files]
+        
+        written = []
+        try:
+            if shard_size_mb:
+                written = self.write_shards(df_out, output_dir, prefix, shard_size_mb, row_group_size)
+            else:
+                written = self.write_per_source(df_out, output_dir)
+        except Exception:
+            # Keep the previous output intact if any write fails
+            for tmp_path in output_dir.glob("*.parquet.tmp"):
+                tmp_path.unlink()
+            raise
+        saved_files = self.replace_outputs(output_dir, written, stale_patterns)
+        
+        message = f"✅ Đã lưu {len(self.modified_indices)} mẫu đã chỉnh sửa vào {len(saved_files)} file:\n"
+        message += "\n".join(f"  - {f}" for f in saved_files[:10])
+        if len(saved_files) > 10:
+            message += f"\n  ... và {len(saved_files) - 10} file khác"
+        message += f"\n\nThư mục: {output_dir}"
+        
+        return message
@@ -0,0 +1,58 @@
+"""Apply a spec file of trims, deletes and transcript fixes without the Gradio UI
+
+Spec file (CSV or JSONL), one operation per row:
+    filename,op,start_ms,end_ms,text
+    abc.wav,trim,0,12000,
+    def.wav,delete,,,
+    ghi.wav,text,,,nội dung đã sửa
+
+Example:
+    python batch_edit.py corrections.csv data/test_edited/*.parquet --dry-run
+    python batch_edit.py corrections.csv data/test_edited/*.parquet --audio-format flac --shard-size-mb 500
+"""
+import argparse
+import sys
+
+from audio_editor import AudioEditorApp, AUDIO_FORMATS, SORT_KEYS, load_edit_spec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch edit audio/transcripts in parquet files")
+    parser.add_argument("spec", help="CSV or JSONL file of edit operations keyed by filename")
+    parser.add_argument("files", nargs="+", help="Parquet files to load")
+    parser.add_argument("--data-dir", default=".", help="Output goes to <data-dir>/test_audio_edited")
+    parser.add_argument("--dry-run", action="store_true", help="Only validate the spec and print the report")
+    parser.add_argument("--audio-format", choices=AUDIO_FORMATS, default=None)
+    parser.add_argument("--shard-size-mb", type=float, default=None)
+    parser.add_argument("--sort-by", choices=SORT_KEYS, default="none")
+    args = parser.parse_args()
+
+    # Read the spec before loading the (large) parquet files so a bad spec fails fast
+    try:
+        edits = load_edit_spec(args.spec)
+        app = AudioEditorApp(args.data_dir)
+        app.load_data(args.files)
+    except (OSError, ValueError) as e:
+        print(f"❌ {str(e)}")
+        sys.exit(1)
+
+    try:
+        print(app.apply_edits(edits, dry_run=args.dry_run))
+    except ValueError as e:
+        print(str(e))
+        sys.exit(1)
+
+    if not args.dry_run:
+        try:
+            print(app.save_modifications(
+                audio_format=args.audio_format,
+                shard_size_mb=args.shard_size_mb,
+                sort_by=args.sort_by
+            ))
+        except ValueError as e:
+            print(f"❌ {str(e)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()